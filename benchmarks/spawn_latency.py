@@ -0,0 +1,45 @@
+"""
+Per-job spawn latency of Stilts.run (the argv list executed directly, with
+no shell), vs. the old shell=True call on Stilts.cmd.
+
+Both go through a real Stilts job, with STILTS_WRAPPER_EXE set to a trivial
+executable (default `true`), so the numbers are the spawn overhead alone -
+not STILTS/JVM startup, which is the same either way. `stilts` must still
+be on the PATH, as importing stilts_wrapper asks it for its version.
+
+    python3 benchmarks/spawn_latency.py --n-jobs 2000
+"""
+
+import argparse
+import os
+import subprocess
+import time
+
+def time_jobs(func, n_jobs):
+    t0 = time.perf_counter()
+    for _ in range(n_jobs):
+        func()
+    return (time.perf_counter() - t0) / n_jobs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-jobs", default=2000, type=int)
+    parser.add_argument("--exe", default="true")
+    args = parser.parse_args()
+
+    # must be set before the import - the exe is read when stilts_wrapper loads.
+    os.environ["STILTS_WRAPPER_EXE"] = args.exe
+    from stilts_wrapper import Stilts
+
+    st = Stilts(
+        "tpipe", in_="my input table.fits", cmd="select x>1; keepcols 'x y'",
+        out="output.fits"
+    )
+
+    shell = time_jobs(lambda: subprocess.call(st.cmd, shell=True), args.n_jobs)
+    direct = time_jobs(lambda: st.run(cleanup=False), args.n_jobs)
+
+    print(f"{args.n_jobs} jobs of {args.exe}: {st.cmd}")
+    print(f"shell=True:  {shell * 1e3:.3f} ms/job")
+    print(f"Stilts.run:  {direct * 1e3:.3f} ms/job")
+    print(f"saving:      {(shell - direct) * 1e3:.3f} ms/job ({(shell - direct) * args.n_jobs:.2f}s total)")
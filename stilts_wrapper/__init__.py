@@ -4,4 +4,8 @@ from .api import (
     StiltsUnknownTaskError,
     StiltsUnknownParameterError
 )
-
+from .exc import StiltsWorkflowError
+from .workflow import Workflow
+from .fanout import Fanout
+from .lazy import LazyTable
+from .distributed import FileQueue
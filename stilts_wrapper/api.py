@@ -1,6 +1,10 @@
 import os
 import logging
+import re
+import shlex
+import shutil
 import subprocess
+import sys
 import traceback
 import yaml
 from pathlib import Path
@@ -9,11 +13,15 @@ from astropy.table import Table
 
 from .known_tasks import load_known_tasks, load_known_flags
 from .exc import StiltsError, StiltsUnknownTaskError, StiltsUnknownParameterError
+from .lazy import LazyTable, LAZY_FORMATS, LAZY_SUFFIXES
 from . import utils
 
 STILTS_EXE = utils.STILTS_EXE
 STILTS_FLAGS = load_known_flags()
 KNOWN_TASKS = load_known_tasks()["all_tasks"]
+INPUT_PARAMETER_PATTERN = re.compile(r"^(in|upload)\d*$")
+OUTPUT_PARAMETER_PATTERN = re.compile("^out$")
+SPAWN_CLOSE_FDS = sys.version_info >= (3, 10)
 
 logger = logging.getLogger("stilts_wrapper")
 
@@ -85,26 +93,34 @@ class Stilts:
             self.parameters[k[:-1]] = self.parameters.pop(k)
 
     def build_cmd(self, float_precision=6):
-        cmd = f"{self.STILTS_EXE} {self.task} "
-       
+        """
+        Build the argument list self.argv, which is executed directly (no shell),
+        and self.cmd, the equivalent shell-quoted string for display.
+        """
+        exe_argv = shlex.split(self.STILTS_EXE) + [self.task]
+        argv = []
+
         #======== Do flags first.
         if len(self.flags) > 0:
             formatted_flags = utils.format_parameters(
                 self.flags, capitalise=False, float_precision=float_precision
             )
-            cmd += " ".join(
-                f"-{flag}" if val == "None" else f"-{flag} {val}" 
-                for flag, val in formatted_flags.items()
-            ) + " "
+            for flag, val in formatted_flags.items():
+                argv.append(f"-{flag}")
+                if val != "None":
+                    argv.append(val)
 
         #======= Now do parameters.
         formatted_parameters = utils.format_parameters(
             self.parameters, capitalise=False, float_precision=float_precision
         )
-        cmd += " ".join(
-            f"{param}={val}" for param, val in formatted_parameters.items()
+        argv.extend(f"{param}={val}" for param, val in formatted_parameters.items())
+
+        self.argv = exe_argv + argv
+        self.cmd = (
+            " ".join(shlex.quote(x) for x in exe_argv) + " "
+            + " ".join(shlex.quote(x) for x in argv)
         )
-        self.cmd = cmd
 
     def update_parameters(self, **kwargs):
         self.parameters.update(kwargs)
@@ -126,12 +142,41 @@ class Stilts:
             fmt_flags[fmtN_key] = fmt      
         self.update_parameters(**fmt_flags)
 
-    def run(self, verbose=False, strict=None, cleanup=True):
+    def get_input_paths(self,):
+        """
+        Paths given to any of the in/inN/uploadN parameters. Strings are split
+        on whitespace, as STILTS does for multi-valued inputs (eg. tcat in=).
+        """
+        paths = []
+        for key, val in self.parameters.items():
+            if not INPUT_PARAMETER_PATTERN.match(key):
+                continue
+            if isinstance(val, Path):
+                paths.append(val)
+            elif isinstance(val, str):
+                paths.extend(Path(v) for v in val.split())
+        return paths
+
+    def get_output_paths(self,):
+        """Paths given to the out parameter."""
+        return [
+            Path(val) for key, val in self.parameters.items()
+            if OUTPUT_PARAMETER_PATTERN.match(key) and isinstance(val, (str, Path))
+        ]
+
+    def run(self, verbose=False, strict=None, cleanup=True, lazy=False):
+        """
+        Run the command. Returns the exit status, or if lazy=True (and the run
+        succeeded), a LazyTable handle on the (fits/colfits) out file.
+        """
         if verbose:
             logger.info("run \033[031m{self.task.upper()}\033[0m")
             logger.info("{self.cmd}")
         
-        status = subprocess.call(self.cmd, shell=True)
+        # full path to exe and close_fds=False lets subprocess use posix_spawn -
+        # faster than fork before python 3.10, but slower than its vfork after.
+        exe = shutil.which(self.argv[0]) or self.argv[0]
+        status = subprocess.call([exe] + self.argv[1:], close_fds=SPAWN_CLOSE_FDS)
         self.status = status
         if cleanup:
             self.cleanup()
@@ -141,8 +186,26 @@ class Stilts:
             docs_hint = utils.get_docs_hint(self.task)
             errormsg = f"run: Something went wrong (status={status}).\n{docs_hint}"
             raise StiltsError(errormsg)
+        if lazy and status == 0:
+            return self.lazy_result()
         return status
 
+    def lazy_result(self, hdu=1):
+        output_paths = self.get_output_paths()
+        if len(output_paths) == 0:
+            raise StiltsError("lazy_result: no 'out' parameter to read.")
+        ofmt = self.parameters.get("ofmt", None)
+        if ofmt is not None:
+            ofmt = str(ofmt)
+            if not any(ofmt.startswith(fmt) for fmt in LAZY_FORMATS):
+                raise StiltsError(f"lazy_result: can only read fits/colfits, not ofmt={ofmt}")
+        elif output_paths[0].suffix.lower() not in LAZY_SUFFIXES:
+            raise StiltsError(
+                f"lazy_result: can only read fits/colfits, not {output_paths[0]} - set ofmt?"
+            )
+        columnar = True if ofmt is not None and ofmt.startswith("colfits") else None
+        return LazyTable(output_paths[0], hdu=hdu, columnar=columnar)
+
     def cleanup(self,):
         for path in self.cleanup_paths:
             logger.info("removing temporary table at {path}")
@@ -181,6 +244,9 @@ class Stilts:
             stilts.set_all_formats(all_formats)
         return stilts
 
-
-
-
+    @classmethod
+    def tpipe(cls, *args, all_formats=None, **kwargs):
+        stilts = cls("tpipe", *args, **kwargs)
+        if all_formats is not None:
+            stilts.set_all_formats(all_formats)
+        return stilts
@@ -0,0 +1,275 @@
+import argparse
+import copy
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from .api import Stilts
+from .exc import StiltsError
+from . import utils
+
+logger = logging.getLogger("stilts_distributed")
+
+class FileQueue:
+    """
+    Queue of Stilts jobs on a shared filesystem, for workers on any node.
+
+    Each job is a json file which moves pending/ -> running/ -> done/ or failed/.
+    Workers claim a job by renaming it into running/ (atomic on POSIX, so
+    only one worker can win). The mtime of the running file is the
+    worker's lease - workers touch it while the job runs, and jobs whose
+    lease is older than lease_timeout (ie. the worker has crashed) are
+    moved back to pending/. A job claimed more than max_attempts times is
+    moved to failed/.
+    """
+
+    def __init__(self, root, lease_timeout=300., max_attempts=3):
+        self.root = Path(root)
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.pending_dir = self.root / "pending"
+        self.running_dir = self.root / "running"
+        self.done_dir = self.root / "done"
+        self.failed_dir = self.root / "failed"
+        self.staged_dir = self.root / "staged"
+        for d in [
+            self.pending_dir, self.running_dir, self.done_dir,
+            self.failed_dir, self.staged_dir
+        ]:
+            d.mkdir(exist_ok=True, parents=True)
+
+    @staticmethod
+    def _write_json(path, data):
+        tmp_path = path.parent / f".{path.name}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        tmp_path.replace(path)
+
+    @staticmethod
+    def _read_json(path):
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def submit(self, stilts, job_id=None):
+        """
+        Serialise a Stilts job into the queue. Temporary tables the job has
+        written (from astropy Table inputs) are moved into the queue's staged/
+        directory, so workers on other nodes can read them - the queue owns
+        them from then on, so don't run or clean up stilts yourself after this.
+        """
+        if job_id is None:
+            job_id = f"{stilts.task}_{uuid.uuid4().hex[:12]}"
+        if (self.pending_dir / f"{job_id}.json").exists():
+            raise StiltsError(f"job {job_id} already in queue")
+
+        parameters = dict(stilts.parameters)
+        staged = []
+        if len(stilts.cleanup_paths) > 0:
+            job_staged_dir = self.staged_dir / job_id
+            job_staged_dir.mkdir(exist_ok=True)
+            for path in stilts.cleanup_paths:
+                staged_path = job_staged_dir / Path(path).name
+                shutil.move(str(path), staged_path)
+                for key, val in parameters.items():
+                    if val == path:
+                        parameters[key] = staged_path
+                staged.append(str(staged_path))
+            stilts.cleanup_paths = []
+        # inputs from the rewritten parameters, so they point at the staged files.
+        queued = copy.copy(stilts)
+        queued.parameters = parameters
+
+        job = {
+            "job_id": job_id,
+            "task": stilts.task,
+            "flags": utils.format_parameters(stilts.flags),
+            "parameters": utils.format_parameters(parameters),
+            "inputs": [str(p) for p in queued.get_input_paths()],
+            "outputs": [str(p) for p in queued.get_output_paths()],
+            "staged": staged,
+            "attempts": 0,
+            "submitted": time.time(),
+        }
+        self._write_json(self.pending_dir / f"{job_id}.json", job)
+        return job_id
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return path.stat().st_mtime
+        except FileNotFoundError:
+            return float("inf") # already claimed - try it last.
+
+    def claim(self, worker_id):
+        """
+        Claim the oldest pending job (by mtime - when it was submitted or
+        requeued). Returns job dict, or None if nothing to do.
+        """
+        pending = sorted(
+            self.pending_dir.glob("*.json"), key=lambda p: (self._mtime(p), p.name)
+        )
+        for pending_path in pending:
+            running_path = self.running_dir / pending_path.name
+            try:
+                # start the lease before the rename - rename keeps the mtime, and
+                # a stale one would let requeue_expired move the job straight back.
+                os.utime(pending_path)
+                os.rename(pending_path, running_path)
+                job = self._read_json(running_path)
+            except FileNotFoundError:
+                continue # another worker got there first.
+            job["attempts"] += 1
+            job["worker"] = worker_id
+            job["claimed"] = time.time()
+            if job["attempts"] > self.max_attempts:
+                job["error"] = f"gave up after {self.max_attempts} attempts"
+                self._write_json(self.failed_dir / pending_path.name, job)
+                os.remove(running_path)
+                continue
+            self._write_json(running_path, job)
+            return job
+        return None
+
+    def heartbeat(self, job_id):
+        try:
+            os.utime(self.running_dir / f"{job_id}.json")
+        except FileNotFoundError:
+            pass
+
+    def complete(self, job, status, error=None):
+        job = dict(job)
+        job["status"] = status
+        job["error"] = error
+        job["finished"] = time.time()
+        finished_dir = self.done_dir if status == 0 else self.failed_dir
+        self._write_json(finished_dir / f"{job['job_id']}.json", job)
+
+        running_path = self.running_dir / f"{job['job_id']}.json"
+        try:
+            if self._read_json(running_path).get("worker") == job["worker"]:
+                os.remove(running_path)
+        except FileNotFoundError:
+            pass
+        if status == 0:
+            shutil.rmtree(self.staged_dir / job["job_id"], ignore_errors=True)
+
+    def requeue_expired(self,):
+        """Move jobs whose lease has expired back to pending. Returns their ids."""
+        requeued = []
+        now = time.time()
+        for running_path in self.running_dir.glob("*.json"):
+            try:
+                if now - running_path.stat().st_mtime < self.lease_timeout:
+                    continue
+                os.rename(running_path, self.pending_dir / running_path.name)
+            except FileNotFoundError:
+                continue
+            logger.warning(f"lease expired on {running_path.stem}, requeued")
+            requeued.append(running_path.stem)
+        return requeued
+
+    def job_ids(self, state):
+        state_dir = getattr(self, f"{state}_dir")
+        return sorted(p.stem for p in state_dir.glob("*.json"))
+
+    def summary(self,):
+        return {
+            state: len(self.job_ids(state))
+            for state in ["pending", "running", "done", "failed"]
+        }
+
+    def status(self, job_id):
+        for state in ["done", "failed", "running", "pending"]:
+            path = getattr(self, f"{state}_dir") / f"{job_id}.json"
+            if path.exists():
+                return state, self._read_json(path)
+        raise StiltsError(f"no job {job_id} in {self.root}")
+
+    def wait(self, job_ids=None, timeout=None, poll_interval=1.):
+        """Block until the given (default all) jobs are done or failed."""
+        t0 = time.time()
+        while True:
+            finished = set(self.job_ids("done")) | set(self.job_ids("failed"))
+            if job_ids is None:
+                unfinished = self.summary()["pending"] + self.summary()["running"]
+            else:
+                unfinished = len(set(job_ids) - finished)
+            if unfinished == 0:
+                return
+            if timeout is not None and time.time() - t0 > timeout:
+                raise StiltsError(f"{unfinished} jobs unfinished after {timeout}s")
+            time.sleep(poll_interval)
+
+def run_job(job):
+    flags = job["flags"]
+    args = [flag for flag, val in flags.items() if val == "None"]
+    flag_kwargs = {flag: val for flag, val in flags.items() if val != "None"}
+    stilts = Stilts(
+        job["task"], *args, strict=False, warning=False,
+        **flag_kwargs, **job["parameters"]
+    )
+    return stilts.run(strict=False, cleanup=False)
+
+def run_worker(
+    root, worker_id=None, lease_timeout=300., max_attempts=3,
+    poll_interval=1., exit_when_empty=False
+):
+    """
+    Claim and run jobs from the queue at root until stopped (or, with
+    exit_when_empty, until there are no pending or running jobs left).
+    """
+    if worker_id is None:
+        worker_id = f"{socket.gethostname()}_{os.getpid()}"
+    fq = FileQueue(root, lease_timeout=lease_timeout, max_attempts=max_attempts)
+    n_jobs = 0
+    while True:
+        fq.requeue_expired()
+        job = fq.claim(worker_id)
+        if job is None:
+            summary = fq.summary()
+            if exit_when_empty and summary["pending"] + summary["running"] == 0:
+                return n_jobs
+            time.sleep(poll_interval)
+            continue
+
+        logger.info(f"{worker_id} running {job['job_id']}")
+        stop = threading.Event()
+        def beat():
+            while not stop.wait(lease_timeout / 3.):
+                fq.heartbeat(job["job_id"])
+        heartbeat = threading.Thread(target=beat, daemon=True)
+        heartbeat.start()
+        t0 = time.time()
+        try:
+            status = run_job(job)
+            error = None if status == 0 else f"status={status}"
+        except Exception as e:
+            status, error = -1, str(e)
+        finally:
+            stop.set()
+            heartbeat.join()
+        job["elapsed"] = time.time() - t0
+        fq.complete(job, status, error=error)
+        n_jobs += 1
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="worker for a stilts_wrapper FileQueue")
+    parser.add_argument("root")
+    parser.add_argument("--worker-id", default=None)
+    parser.add_argument("--lease-timeout", default=300., type=float)
+    parser.add_argument("--max-attempts", default=3, type=int)
+    parser.add_argument("--poll-interval", default=1., type=float)
+    parser.add_argument("--exit-when-empty", action="store_true", default=False)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    run_worker(
+        args.root, worker_id=args.worker_id, lease_timeout=args.lease_timeout,
+        max_attempts=args.max_attempts, poll_interval=args.poll_interval,
+        exit_when_empty=args.exit_when_empty,
+    )
@@ -6,3 +6,6 @@ class StiltsUnknownParameterError(StiltsError):
 
 class StiltsUnknownTaskError(StiltsError):
     pass
+
+class StiltsWorkflowError(StiltsError):
+    pass
@@ -0,0 +1,124 @@
+import logging
+import os
+import uuid
+from pathlib import Path
+
+from astropy.io import fits
+from astropy.table import Table
+
+from .api import Stilts
+from .exc import StiltsError
+
+logger = logging.getLogger("stilts_fanout")
+
+FITS_SUFFIXES = [".fits", ".fit", ".fts"]
+
+def _is_fits(path, fmt=None):
+    if fmt is not None:
+        return fmt.startswith("fits") or fmt.startswith("colfits")
+    return Path(path).suffix.lower() in FITS_SUFFIXES
+
+class Fanout:
+    """
+    Run several tpipe-style jobs on one input in a single STILTS invocation.
+
+    specs is a list of (cmd, out) pairs, where cmd is a filter command string
+    (or list of them, joined with ';') as you'd give to tpipe's cmd parameter.
+    All jobs run in one tmultin call, which writes each filtered table as an
+    extension of one multi-extension FITS file; this is then split into
+    the individual outputs, which must be FITS.
+
+    tmultin opens the input once per spec. That's cheap for (uncompressed)
+    FITS, which is memory-mapped, so any other input is first converted to
+    a temporary FITS file with one tpipe - it's only parsed once either way.
+    """
+
+    def __init__(self, in_, specs, ifmt=None, strict=True, warning=True):
+        if len(specs) == 0:
+            raise StiltsError("Fanout needs at least one (cmd, out) spec")
+        self.specs = [(self.join_cmd(cmd), Path(out)) for cmd, out in specs]
+        for cmd, out in self.specs:
+            if not _is_fits(out):
+                raise StiltsError(f"Fanout only writes FITS - can't write {out}")
+        self.temp_paths = []
+        self.convert = None
+
+        # unique per Fanout, so others in this process (or directory) don't clash.
+        temp_dir = self.specs[0][1].parent
+        temp_stem = f"api_written_temp_fanout_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        self.multi_path = temp_dir / f"{temp_stem}.fits"
+
+        if isinstance(in_, Table):
+            input_path = temp_dir / f"{temp_stem}_in.cat.fits"
+            in_.write(input_path, overwrite=True)
+            self.temp_paths.append(input_path)
+            in_ = input_path
+            ifmt = "fits"
+        self.input_path = in_
+
+        if not _is_fits(in_, fmt=ifmt):
+            converted_path = temp_dir / f"{temp_stem}_in.fits"
+            convert_parameters = {"in": in_, "out": converted_path, "ofmt": "fits"}
+            if ifmt is not None:
+                convert_parameters["ifmt"] = ifmt
+            self.convert = Stilts(
+                "tpipe", strict=strict, warning=warning, **convert_parameters
+            )
+            self.temp_paths.append(converted_path)
+            in_ = converted_path
+            ifmt = "fits"
+
+        parameters = {"nin": len(self.specs)}
+        for ii, (cmd, out) in enumerate(self.specs, 1):
+            parameters[f"in{ii}"] = in_
+            if ifmt is not None:
+                parameters[f"ifmt{ii}"] = ifmt
+            if cmd is not None:
+                parameters[f"icmd{ii}"] = cmd
+        parameters["out"] = self.multi_path
+        parameters["ofmt"] = "fits"
+        self.stilts = Stilts(
+            "tmultin", strict=strict, warning=warning, **parameters
+        )
+
+    @staticmethod
+    def join_cmd(cmd):
+        if cmd is None or isinstance(cmd, str):
+            return cmd
+        return ";".join(cmd)
+
+    @property
+    def cmd(self,):
+        return self.stilts.cmd
+
+    def split_outputs(self,):
+        with fits.open(self.multi_path, memmap=True) as hdul:
+            table_hdus = hdul[1:]
+            if len(table_hdus) != len(self.specs):
+                raise StiltsError(
+                    f"expected {len(self.specs)} tables in {self.multi_path}, "
+                    f"found {len(table_hdus)}"
+                )
+            for hdu, (cmd, out) in zip(table_hdus, self.specs):
+                fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(out, overwrite=True)
+                logger.info(f"written {out}")
+
+    def run(self, strict=None, cleanup=True):
+        try:
+            if self.convert is not None:
+                status = self.convert.run(strict=strict, cleanup=cleanup)
+                if status > 0:
+                    return status
+            status = self.stilts.run(strict=strict, cleanup=cleanup)
+            if status == 0:
+                self.split_outputs()
+        finally:
+            if cleanup:
+                self.cleanup()
+        return status
+
+    def cleanup(self,):
+        for path in self.temp_paths + [self.multi_path]:
+            if Path(path).exists():
+                os.remove(path)
+        self.temp_paths = []
@@ -0,0 +1,117 @@
+import logging
+from pathlib import Path
+
+import numpy as np
+
+from astropy.io import fits
+from astropy.table import Table
+
+from .exc import StiltsError
+
+logger = logging.getLogger("stilts_lazy")
+
+LAZY_FORMATS = ["fits", "colfits"]
+LAZY_SUFFIXES = [".fits", ".fit", ".fts", ".colfits"]
+
+class LazyTable:
+    """
+    Lazy handle on a FITS (or colfits) table. The file is memory-mapped, and
+    columns/rows are only read when asked for. Row count and schema come
+    from the header, so they're available without reading any data.
+
+    For colfits (as written by STILTS with ofmt=colfits-basic/colfits-plus),
+    the table is stored as one row with one cell per column - set
+    columnar=True, or use a path ending .colfits.
+    """
+
+    def __init__(self, path, hdu=1, columnar=None):
+        self.path = Path(path)
+        if columnar is None:
+            columnar = self.path.suffix == ".colfits"
+        self.columnar = columnar
+        self.hdul = fits.open(self.path, memmap=True)
+        try:
+            self.hdu = self.hdul[hdu]
+            if not isinstance(self.hdu, fits.BinTableHDU):
+                raise StiltsError(f"HDU {hdu} of {self.path} is not a binary table")
+            self.colnames = list(self.hdu.columns.names)
+            self.nrows = self._get_nrows()
+        except Exception:
+            # nobody gets a handle to close, so don't leave the file open.
+            self.hdul.close()
+            raise
+
+    def _get_nrows(self,):
+        if not self.columnar:
+            return self.hdu.header["NAXIS2"]
+        if self.hdu.header["NAXIS2"] != 1:
+            raise StiltsError(f"{self.path} has more than one row - not colfits?")
+        if len(self.colnames) == 0:
+            return 0
+        col = self.hdu.columns[0]
+        if col.dim is not None:
+            # TDIM is fortran-ordered, so rows are the last axis.
+            return int(col.dim.strip("()").split(",")[-1])
+        return col.format.repeat
+
+    @property
+    def schema(self,):
+        """dict of column name: (dtype of one row, unit)."""
+        dtypes = self.hdu.columns.dtype
+        schema = {}
+        for col in self.hdu.columns:
+            dtype = dtypes[col.name]
+            if self.columnar:
+                dtype = np.dtype((dtype.base, dtype.shape[1:]))
+            schema[col.name] = (dtype, col.unit)
+        return schema
+
+    def __len__(self,):
+        return self.nrows
+
+    def __repr__(self,):
+        return f"<LazyTable {self.path} nrows={self.nrows} ncols={len(self.colnames)}>"
+
+    def column(self, name):
+        """Memory-mapped array for one column (no copy)."""
+        if name not in self.colnames:
+            raise KeyError(f"no column '{name}' in {self.path}")
+        field = self.hdu.data.field(name)
+        if self.columnar:
+            return field[0]
+        return field
+
+    def __getitem__(self, item):
+        if isinstance(item, str):
+            return self.column(item)
+        if isinstance(item, (list, tuple)) and all(isinstance(x, str) for x in item):
+            return self.to_table(columns=item)
+        return self.to_table(rows=item)
+
+    def to_table(self, columns=None, rows=None):
+        """
+        Read the selected columns and rows (slice, int or index array) into
+        an astropy Table. Unselected columns and rows are not read.
+        """
+        if columns is None:
+            columns = self.colnames
+        if rows is None:
+            rows = slice(None)
+        elif isinstance(rows, (int, np.integer)):
+            rows = slice(rows, rows + 1)
+        units = {col.name: col.unit for col in self.hdu.columns}
+        tab = Table()
+        for name in columns:
+            tab[name] = np.array(self.column(name)[rows])
+            if units[name] is not None:
+                tab[name].unit = units[name]
+        return tab
+
+    def close(self,):
+        self.hdul.close()
+
+    def __enter__(self,):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,215 @@
+import copy
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+from astropy.table import Table, vstack
+
+from .exc import StiltsError
+
+logger = logging.getLogger("stilts_partition")
+
+MANIFEST_NAME = "manifest.json"
+PARTITION_FORMATS = {"fits": ".fits", "parquet": ".parquet"}
+
+def healpix_nest_index(order, ra, dec):
+    """
+    HEALPix NESTED pixel index at the given order for ra, dec in degrees.
+    Same scheme as STILTS' healpixNestIndex(k, lon, lat).
+    """
+    nside = 2 ** order
+    ra = np.asarray(ra, dtype=float)
+    dec = np.asarray(dec, dtype=float)
+    z = np.sin(np.radians(dec))
+    za = np.abs(z)
+    tt = np.mod(np.radians(ra), 2 * np.pi) / (np.pi / 2) # in [0, 4)
+
+    ix = np.zeros(z.shape, dtype=np.int64)
+    iy = np.zeros(z.shape, dtype=np.int64)
+    face = np.zeros(z.shape, dtype=np.int64)
+
+    #====== equatorial region
+    eq = za <= 2. / 3.
+    temp1 = nside * (0.5 + tt[eq])
+    temp2 = nside * z[eq] * 0.75
+    jp = (temp1 - temp2).astype(np.int64)
+    jm = (temp1 + temp2).astype(np.int64)
+    ifp = jp >> order
+    ifm = jm >> order
+    face[eq] = np.where(ifp == ifm, ifp | 4, np.where(ifp < ifm, ifp, ifm + 8))
+    ix[eq] = jm & (nside - 1)
+    iy[eq] = nside - (jp & (nside - 1)) - 1
+
+    #====== polar caps
+    pol = ~eq
+    ntt = np.minimum(tt[pol].astype(np.int64), 3)
+    tp = tt[pol] - ntt
+    tmp = nside * np.sqrt(3 * (1 - za[pol]))
+    jp = np.minimum((tp * tmp).astype(np.int64), nside - 1)
+    jm = np.minimum(((1. - tp) * tmp).astype(np.int64), nside - 1)
+    north = z[pol] >= 0
+    face[pol] = np.where(north, ntt, ntt + 8)
+    ix[pol] = np.where(north, nside - jm - 1, jp)
+    iy[pol] = np.where(north, nside - jp - 1, jm)
+
+    #====== interleave bits of ix, iy
+    ipix = np.zeros(z.shape, dtype=np.int64)
+    for bit in range(order):
+        ipix |= ((ix >> bit) & 1) << (2 * bit)
+        ipix |= ((iy >> bit) & 1) << (2 * bit + 1)
+    return face * nside ** 2 + ipix
+
+def _partition_name(tile, value=None):
+    if value is None:
+        return f"tile={tile}"
+    return f"tile={tile}/value={value}"
+
+def _column_stats(tab):
+    stats = {}
+    for col in tab.colnames:
+        data = tab[col]
+        if data.dtype.kind not in "iuf" or len(data.shape) > 1:
+            continue
+        values = np.asarray(data, dtype=float)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            stats[col] = {"min": None, "max": None}
+        else:
+            stats[col] = {"min": float(values.min()), "max": float(values.max())}
+    return stats
+
+def write_partitioned(
+    tab, output_dir, ra="ra", dec="dec", order=5, partition_column=None, fmt="fits"
+):
+    """
+    Split a table into one file per HEALPix tile (and per partition_column
+    value, if given), and write a manifest with row counts and column min/max.
+    """
+    if fmt not in PARTITION_FORMATS:
+        raise StiltsError(f"fmt '{fmt}' not one of {list(PARTITION_FORMATS)}")
+    if not isinstance(tab, Table):
+        # memory-mapped, so only the rows of one partition are in memory at once.
+        tab = Table.read(tab, format="fits", memmap=True, character_as_bytes=False)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(exist_ok=True, parents=True)
+
+    #====== sort rows by (tile, value) once, then each partition is a contiguous range.
+    tiles = healpix_nest_index(order, tab[ra], tab[dec])
+    if partition_column is None:
+        values = None
+        keys = tiles
+    else:
+        values, value_ids = np.unique(np.asarray(tab[partition_column]), return_inverse=True)
+        keys = tiles * len(values) + value_ids.reshape(-1)
+    sort_order = np.argsort(keys, kind="stable")
+    unique_keys, starts = np.unique(keys[sort_order], return_index=True)
+    ends = np.append(starts[1:], len(sort_order))
+
+    partitions = []
+    for key, start, end in zip(unique_keys, starts, ends):
+        part = tab[sort_order[start:end]]
+        if values is None:
+            tile, value = int(key), None
+        else:
+            tile, value = int(key // len(values)), values[key % len(values)].item()
+            if isinstance(value, bytes):
+                value = value.decode() # for the path and the (json) manifest.
+        relative_path = Path(_partition_name(tile, value)) / f"part{PARTITION_FORMATS[fmt]}"
+        part_path = output_dir / relative_path
+        part_path.parent.mkdir(exist_ok=True, parents=True)
+        part.write(part_path, format=fmt, overwrite=True)
+        partitions.append({
+            "path": str(relative_path),
+            "tile": tile,
+            "value": value,
+            "nrows": len(part),
+            "stats": _column_stats(part),
+        })
+
+    manifest = {
+        "order": order,
+        "ra": ra,
+        "dec": dec,
+        "partition_column": partition_column,
+        "fmt": fmt,
+        "columns": tab.colnames,
+        "nrows": len(tab),
+        "partitions": partitions,
+    }
+    # write then rename, so a failed write doesn't leave a truncated manifest.
+    tmp_path = output_dir / f"{MANIFEST_NAME}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    tmp_path.replace(output_dir / MANIFEST_NAME)
+    logger.info(f"written {len(partitions)} partitions to {output_dir}")
+    return manifest
+
+def load_manifest(output_dir):
+    manifest_path = Path(output_dir) / MANIFEST_NAME
+    if not manifest_path.exists():
+        raise StiltsError(f"no partition manifest at {manifest_path}")
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+def read_partitioned(output_dir, tiles=None, columns=None, values=None):
+    """
+    Read back a partitioned dataset, loading only the partition files for
+    the requested tiles (and partition_column values), and only the
+    requested columns.
+    """
+    output_dir = Path(output_dir)
+    manifest = load_manifest(output_dir)
+    partitions = manifest["partitions"]
+    if tiles is not None:
+        tiles = set(int(t) for t in np.atleast_1d(tiles))
+        partitions = [p for p in partitions if p["tile"] in tiles]
+    if values is not None:
+        values = set(np.atleast_1d(values).tolist())
+        partitions = [p for p in partitions if p["value"] in values]
+
+    if columns is None:
+        columns = manifest["columns"]
+    tables = []
+    for part in partitions:
+        part_path = output_dir / part["path"]
+        if manifest["fmt"] == "parquet":
+            part_tab = Table.read(part_path, format="parquet", include_names=columns)
+            part_tab = part_tab[columns] # in the requested order, as for fits.
+        else:
+            part_tab = Table.read(part_path, format="fits", memmap=True)
+            part_tab = Table(part_tab[columns], copy=True)
+        tables.append(part_tab)
+    if len(tables) == 0:
+        return Table(names=columns)
+    return vstack(tables, join_type="exact")
+
+def run_partitioned(
+    stilts, output_dir, ra="ra", dec="dec", order=5, partition_column=None, fmt="fits"
+):
+    """
+    Run a Stilts job which writes a table (eg. tskymatch2, tmatchn), and write
+    its output as a partitioned dataset in output_dir rather than to one file.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(exist_ok=True, parents=True)
+    temp_path = output_dir / f"api_written_temp_{stilts.task}_out.cat.fits"
+    # work on a copy, so the caller's job keeps its own out/omode/ofmt, and its
+    # temporary Table inputs - it's left to the caller to clean those up.
+    job = copy.copy(stilts)
+    job.parameters = dict(stilts.parameters)
+    job.cleanup_paths = []
+    job.update_parameters(out=temp_path, omode="out", ofmt="fits")
+    try:
+        status = job.run()
+        if status == 0:
+            write_partitioned(
+                temp_path, output_dir, ra=ra, dec=dec, order=order,
+                partition_column=partition_column, fmt=fmt
+            )
+    finally:
+        if temp_path.exists():
+            os.remove(temp_path)
+    return status
@@ -0,0 +1,239 @@
+import logging
+import os
+import queue
+import re
+import socket
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .api import Stilts
+from .exc import StiltsError
+from .fanout import _is_fits
+from . import utils
+
+logger = logging.getLogger("stilts_plotting")
+
+PLOT_INPUT_PATTERN = re.compile(r"^in(\d*)$")
+
+def get_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class PlotServer:
+    """
+    One long-lived `stilts server` process, which renders plot2* tasks
+    sent to it over HTTP, so repeated plots don't pay JVM startup costs.
+    """
+
+    def __init__(self, port=None, basepath="/stilts", startup_timeout=60.):
+        self.port = port or get_free_port()
+        self.basepath = basepath
+        self.startup_timeout = startup_timeout
+        self.stilts = Stilts("server", port=self.port, basepath=basepath)
+        self.process = None
+
+    @property
+    def url(self,):
+        return f"http://127.0.0.1:{self.port}{self.basepath}"
+
+    def start(self, wait=True):
+        self.process = subprocess.Popen(
+            self.stilts.argv,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        if wait:
+            self.wait_until_ready()
+        return self
+
+    def wait_until_ready(self,):
+        t0 = time.time()
+        while time.time() - t0 < self.startup_timeout:
+            if self.process.poll() is not None:
+                raise StiltsError(
+                    f"server exited with status {self.process.returncode}:\n{self.stilts.cmd}"
+                )
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=1.):
+                    return
+            except OSError:
+                time.sleep(0.1)
+        self.stop()
+        raise StiltsError(f"server not up after {self.startup_timeout}s:\n{self.stilts.cmd}")
+
+    def stop(self,):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+    def __enter__(self,):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def render(self, task, out, timeout=300., **parameters):
+        """
+        Render one plot, writing the image the server returns to out.
+        The image format is taken from the extension of out, unless ofmt is given.
+        """
+        out = Path(out)
+        parameters.setdefault("ofmt", out.suffix.lstrip(".") or "png")
+        parameters.setdefault("omode", "out")
+        formatted = utils.format_parameters(parameters)
+        query = urllib.parse.urlencode(formatted)
+        url = f"{self.url}/task/{task}?{query}"
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                image = response.read()
+        except urllib.error.HTTPError as e:
+            msg = e.read().decode(errors="replace").strip()
+            raise StiltsError(f"{task} failed (HTTP {e.code}): {msg}")
+        except urllib.error.URLError as e:
+            raise StiltsError(f"{task} failed: {e.reason}")
+        with open(out, "wb") as f:
+            f.write(image)
+
+def shared_inputs(specs):
+    """
+    Find the non-FITS input tables used by more than one spec. Returns dict
+    of (path, ifmt): list of (spec index, input parameter).
+    """
+    uses = {}
+    for ii, spec in enumerate(specs):
+        for key, val in spec.items():
+            match = PLOT_INPUT_PATTERN.match(key)
+            if match is None or not isinstance(val, (str, Path)):
+                continue
+            ifmt = spec.get(f"ifmt{match.group(1)}", None)
+            if _is_fits(val, fmt=ifmt):
+                continue # memory-mapped by the server, so already cheap to reload.
+            uses.setdefault((str(val), ifmt), []).append((ii, key))
+    return {inputs: keys for inputs, keys in uses.items() if len(keys) > 1}
+
+def convert_shared_inputs(specs, work_dir=None, max_workers=2):
+    """
+    Convert each non-FITS input shared by several specs to a temporary FITS
+    file once, so the servers memory-map it instead of parsing it for every
+    plot. Returns the rewritten specs, and the temporary paths to remove.
+    Inputs which fail to convert are left alone - their plots report the error.
+    """
+    work_dir = Path(work_dir or Path.cwd())
+    work_dir.mkdir(exist_ok=True, parents=True)
+    temp_stem = f"api_written_temp_plot_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+    specs = [dict(spec) for spec in specs]
+    jobs = []
+    for ii, ((path, ifmt), keys) in enumerate(shared_inputs(specs).items()):
+        converted_path = work_dir / f"{temp_stem}_{ii}.fits"
+        parameters = {"in": path, "out": converted_path, "ofmt": "fits"}
+        if ifmt is not None:
+            parameters["ifmt"] = ifmt
+        convert = Stilts("tpipe", strict=False, warning=False, **parameters)
+        jobs.append((convert, converted_path, keys))
+
+    def run(convert):
+        try:
+            return convert.run(strict=False) == 0
+        except Exception as e:
+            logger.warning(f"couldn't convert {convert.parameters['in']}: {e}")
+            return False
+
+    temp_paths = []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        converted = list(executor.map(run, [convert for convert, _, _ in jobs]))
+    for ok, (convert, converted_path, keys) in zip(converted, jobs):
+        if Path(converted_path).exists():
+            temp_paths.append(converted_path)
+        if not ok:
+            continue
+        for ii, key in keys:
+            specs[ii][key] = converted_path
+            specs[ii][f"ifmt{PLOT_INPUT_PATTERN.match(key).group(1)}"] = "fits"
+    return specs, temp_paths
+
+def render_plots(
+    specs, n_workers=2, timeout=300., startup_timeout=60., work_dir=None
+):
+    """
+    Render many plots with a pool of n_workers stilts servers.
+
+    Each spec is a dict with "task" (eg. plot2sky, plot2plane), "out", and
+    the plot parameters. Non-FITS input tables shared by several plots are
+    first converted to temporary FITS files in work_dir (default cwd), so
+    they're parsed once per batch rather than once per plot.
+    Returns a list (in the order of specs) of dicts with keys out, status
+    ("ok" or "failed"), time (seconds), worker, and error.
+    """
+    for spec in specs:
+        if "task" not in spec or "out" not in spec:
+            raise StiltsError(f"plot spec needs 'task' and 'out': {spec}")
+
+    if len(specs) == 0:
+        return []
+    work = queue.Queue()
+    for ii in range(len(specs)):
+        work.put(ii)
+    results = [None] * len(specs)
+    temp_paths = []
+
+    def worker(worker_id, server):
+        while True:
+            try:
+                ii = work.get_nowait()
+            except queue.Empty:
+                return
+            parameters = dict(specs[ii])
+            task = parameters.pop("task")
+            out = parameters.pop("out")
+            result = {"out": out, "worker": worker_id, "error": None}
+            t0 = time.perf_counter()
+            try:
+                server.render(task, out, timeout=timeout, **parameters)
+                result["status"] = "ok"
+            except Exception as e:
+                # eg. timeouts or dropped connections, which urlopen doesn't wrap -
+                # one bad plot mustn't kill the worker and leave its queue undone.
+                result["status"] = "failed"
+                result["error"] = str(e) or type(e).__name__
+                logger.warning(f"plot {out} failed: {e!r}")
+            result["time"] = time.perf_counter() - t0
+            results[ii] = result
+
+    n_workers = max(1, min(n_workers, work.qsize()))
+    servers = [PlotServer(startup_timeout=startup_timeout) for _ in range(n_workers)]
+    try:
+        # start all the JVMs at once, rather than waiting for each in turn.
+        for server in servers:
+            server.start(wait=False)
+        # ...and convert shared inputs while they start up.
+        specs, temp_paths = convert_shared_inputs(
+            specs, work_dir=work_dir, max_workers=n_workers
+        )
+        for server in servers:
+            server.wait_until_ready()
+        threads = [
+            threading.Thread(target=worker, args=(worker_id, server))
+            for worker_id, server in enumerate(servers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        for server in servers:
+            server.stop()
+        for path in temp_paths:
+            if Path(path).exists():
+                os.remove(path)
+    return results
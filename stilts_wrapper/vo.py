@@ -0,0 +1,185 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from pathlib import Path
+
+import numpy as np
+
+from astropy.coordinates import SkyCoord
+from astropy.table import Table, vstack
+
+from .api import Stilts
+from .exc import StiltsError
+
+logger = logging.getLogger("stilts_vo")
+
+def run_with_retries(stilts, retries=3, backoff=1.0, stop=None):
+    """
+    Run a job, retrying with exponential backoff (backoff, 2*backoff, ...)
+    if it fails. Raises StiltsError once all attempts have failed (setting
+    the threading.Event stop, if given), or if stop is set before a retry.
+    """
+    for attempt in range(retries + 1):
+        if stop is not None and stop.is_set():
+            raise StiltsError(f"{stilts.task} cancelled")
+        try:
+            status = stilts.run(strict=True, cleanup=False)
+        except StiltsError as e:
+            status = e
+        if status == 0:
+            return attempt
+        if attempt < retries:
+            wait = backoff * 2 ** attempt
+            logger.warning(f"{stilts.task} failed (attempt {attempt + 1}), retry in {wait}s")
+            if stop is not None:
+                stop.wait(wait)
+            else:
+                time.sleep(wait)
+    if stop is not None:
+        stop.set() # so jobs starting from now on don't run at all.
+    raise StiltsError(f"{stilts.task} failed after {retries + 1} attempts:\n{stilts.cmd}")
+
+def run_concurrently(jobs, max_workers=4, retries=3, backoff=1.0):
+    """
+    Run a list of Stilts jobs with at most max_workers at once, each with
+    retries. Returns the number of retries each job needed. If any job fails,
+    jobs which haven't started are cancelled, and running ones stop retrying.
+    """
+    stop = threading.Event()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    run_with_retries, job, retries=retries, backoff=backoff, stop=stop
+                )
+                for job in jobs
+            ]
+            try:
+                # notice the first failure as soon as it happens, not in submission order.
+                wait(futures, return_when=FIRST_EXCEPTION)
+                return [future.result() for future in futures]
+            except BaseException:
+                stop.set()
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        # only once the executor has exited - nothing is still using the inputs.
+        for job in jobs:
+            job.cleanup()
+
+def merge_outputs(paths, index_column="query_index"):
+    """
+    Stack the (fits) outputs of several queries into one table, with a
+    column saying which query each row came from.
+    """
+    tables = []
+    for ii, path in enumerate(paths):
+        tab = Table.read(path, format="fits")
+        if index_column is not None:
+            tab[index_column] = np.full(len(tab), ii, dtype=int)
+        tables.append(tab)
+    return vstack(tables, metadata_conflicts="silent")
+
+def chunk_table(tab, chunk_size):
+    return [tab[ii:ii + chunk_size] for ii in range(0, len(tab), chunk_size)]
+
+def _fanout(jobs, output_paths, max_workers, retries, backoff, cleanup, index_column="query_index"):
+    try:
+        run_concurrently(jobs, max_workers=max_workers, retries=retries, backoff=backoff)
+        return merge_outputs(output_paths, index_column=index_column)
+    finally:
+        if cleanup:
+            for path in output_paths:
+                if path.exists():
+                    os.remove(path)
+
+def _work_dir(work_dir):
+    work_dir = Path(work_dir or Path.cwd())
+    work_dir.mkdir(exist_ok=True, parents=True)
+    return work_dir
+
+def cone_fanout(
+    serviceurl, positions, radius, chunk_size=100, max_workers=4, parallel=1,
+    retries=3, backoff=1.0, work_dir=None, cleanup=True, **kwargs
+):
+    """
+    Do a cone search (radius in deg) around each of positions - a SkyCoord,
+    or list of (ra, dec) - and return all results as one table.
+    Positions are sent in chunks of chunk_size, each as one coneskymatch job
+    making up to parallel queries at once - so there are at most
+    max_workers * parallel queries in flight.
+    The results have columns query_ra, query_dec and query_id (the index
+    of the position in positions).
+    """
+    if isinstance(positions, SkyCoord):
+        positions = list(zip(positions.ra.deg, positions.dec.deg))
+    positions = np.array(positions, dtype=float).reshape(-1, 2)
+    tab = Table({
+        "query_ra": positions[:, 0],
+        "query_dec": positions[:, 1],
+        "query_id": np.arange(len(positions)),
+    })
+    return _skymatch_fanout(
+        "coneskymatch", tab, chunk_size, max_workers, retries, backoff, work_dir,
+        cleanup, index_column=None, serviceurl=serviceurl,
+        ra="query_ra", dec="query_dec", sr=float(radius), parallel=parallel, **kwargs
+    )
+
+def tap_fanout(
+    tapurl, queries, max_workers=4, retries=3, backoff=1.0,
+    work_dir=None, cleanup=True, **kwargs
+):
+    """
+    Run each ADQL query in queries against tapurl, and return all results
+    as one table.
+    """
+    work_dir = _work_dir(work_dir)
+    jobs = []
+    output_paths = []
+    for ii, adql in enumerate(queries):
+        output_path = work_dir / f"api_written_temp_tapquery_{os.getpid()}_{ii}.fits"
+        jobs.append(Stilts(
+            "tapquery", tapurl=tapurl, adql=adql,
+            out=output_path, ofmt="fits", omode="out", **kwargs
+        ))
+        output_paths.append(output_path)
+    return _fanout(jobs, output_paths, max_workers, retries, backoff, cleanup)
+
+def skymatch_fanout(
+    task, tab, chunk_size=10000, max_workers=4, retries=3, backoff=1.0,
+    work_dir=None, cleanup=True, **kwargs
+):
+    """
+    Split tab into chunks of chunk_size rows, and match each chunk against a
+    remote service with task (cdsskymatch, tapskymatch, coneskymatch).
+    Returns all matches as one table.
+    """
+    if task not in ["cdsskymatch", "tapskymatch", "coneskymatch"]:
+        raise StiltsError(f"skymatch_fanout can't do task {task}")
+    return _skymatch_fanout(
+        task, tab, chunk_size, max_workers, retries, backoff, work_dir, cleanup, **kwargs
+    )
+
+def _skymatch_fanout(
+    task, tab, chunk_size, max_workers, retries, backoff, work_dir, cleanup,
+    index_column="query_index", **kwargs
+):
+    work_dir = _work_dir(work_dir)
+    jobs = []
+    output_paths = []
+    for ii, chunk in enumerate(chunk_table(tab, chunk_size)):
+        input_path = work_dir / f"api_written_temp_{task}_{os.getpid()}_in{ii}.fits"
+        output_path = work_dir / f"api_written_temp_{task}_{os.getpid()}_out{ii}.fits"
+        chunk.write(input_path, overwrite=True)
+        jobs.append(Stilts(
+            task, in_=input_path, ifmt="fits",
+            out=output_path, ofmt="fits", omode="out", **kwargs
+        ))
+        jobs[-1].cleanup_paths.append(input_path)
+        output_paths.append(output_path)
+    return _fanout(
+        jobs, output_paths, max_workers, retries, backoff, cleanup, index_column=index_column
+    )
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+
+from .exc import StiltsError, StiltsWorkflowError
+
+logger = logging.getLogger("stilts_workflow")
+
+class Workflow:
+    """
+    Run several Stilts jobs as a make-style DAG.
+
+    Dependencies are inferred from the paths: a step whose in/inN/uploadN
+    is another step's out runs after it. Independent steps run in parallel.
+    A step is skipped if all its outputs exist, are newer than all its inputs,
+    and its command is unchanged since it last completed. Completed steps
+    are recorded in state_path as they finish, so an interrupted workflow
+    resumes from where it stopped.
+    """
+
+    def __init__(self, state_path=None, max_workers=4):
+        if state_path is None:
+            state_path = Path.cwd() / "stilts_workflow_state.json"
+        self.state_path = Path(state_path)
+        self.max_workers = max_workers
+        self.steps = {}
+
+    def add(self, stilts, name=None):
+        if name is None:
+            name = f"{stilts.task}_{len(self.steps)}"
+        if len(stilts.cleanup_paths) > 0:
+            # temp table names are fixed per task/parameter, so parallel steps would clash.
+            raise StiltsWorkflowError(
+                f"step '{name}' has astropy Table inputs - write them to files first"
+            )
+        if name in self.steps:
+            raise StiltsWorkflowError(f"step '{name}' already in workflow")
+        self.steps[name] = stilts
+        return name
+
+    def get_dependencies(self,):
+        producers = {}
+        for name, stilts in self.steps.items():
+            for path in stilts.get_output_paths():
+                path = path.resolve()
+                if path in producers:
+                    raise StiltsWorkflowError(
+                        f"steps '{producers[path]}' and '{name}' both write {path}"
+                    )
+                producers[path] = name
+
+        dependencies = {}
+        for name, stilts in self.steps.items():
+            dependencies[name] = set(
+                producers[path.resolve()] for path in stilts.get_input_paths()
+                if path.resolve() in producers
+            )
+            if name in dependencies[name]:
+                raise StiltsWorkflowError(f"step '{name}' reads its own output")
+        self.topological_order(dependencies)
+        return dependencies
+
+    def topological_order(self, dependencies=None):
+        if dependencies is None:
+            dependencies = self.get_dependencies()
+        order = []
+        remaining = {name: set(deps) for name, deps in dependencies.items()}
+        while len(remaining) > 0:
+            ready = [name for name, deps in remaining.items() if len(deps) == 0]
+            if len(ready) == 0:
+                raise StiltsWorkflowError(f"cycle between steps {list(remaining)}")
+            for name in ready:
+                remaining.pop(name)
+                order.append(name)
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        return order
+
+    @staticmethod
+    def command_hash(stilts):
+        return hashlib.sha256(stilts.cmd.encode()).hexdigest()
+
+    def load_state(self,):
+        if not self.state_path.exists():
+            return {}
+        with open(self.state_path, "r") as f:
+            return json.load(f)
+
+    def write_state(self, state):
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=2)
+        tmp_path.replace(self.state_path)
+
+    def is_up_to_date(self, name, state):
+        stilts = self.steps[name]
+        if state.get(name, {}).get("cmd_hash") != self.command_hash(stilts):
+            return False
+        output_paths = stilts.get_output_paths()
+        if len(output_paths) == 0:
+            return False
+        if not all(path.exists() for path in output_paths):
+            return False
+        oldest_output = min(path.stat().st_mtime for path in output_paths)
+        input_mtimes = [p.stat().st_mtime for p in stilts.get_input_paths() if p.exists()]
+        return all(mtime <= oldest_output for mtime in input_mtimes)
+
+    def run(self, max_workers=None, force=False):
+        """
+        Run all out-of-date steps. Returns dict of step name: status,
+        where status is "skipped" for steps which were already up to date.
+        """
+        max_workers = max_workers or self.max_workers
+        dependencies = self.get_dependencies()
+        state = {} if force else self.load_state()
+        state = {name: val for name, val in state.items() if name in self.steps}
+
+        results = {}
+        failed = {}
+        pending = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                scheduled = True
+                while scheduled and len(failed) == 0:
+                    scheduled = False
+                    for name, deps in dependencies.items():
+                        if name in results or name in pending.values():
+                            continue
+                        if not all(dep in results for dep in deps):
+                            continue
+                        scheduled = True
+                        # upstream steps have all finished, so input mtimes are final.
+                        if self.is_up_to_date(name, state):
+                            logger.info(f"skip up-to-date step {name}")
+                            self.steps[name].cleanup()
+                            results[name] = "skipped"
+                        else:
+                            # forget it completed until it does again - a failed
+                            # run may still leave a fresh-looking output behind.
+                            if state.pop(name, None) is not None:
+                                self.write_state(state)
+                            future = executor.submit(self.steps[name].run)
+                            pending[future] = name
+                if len(pending) == 0:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = pending.pop(future)
+                    try:
+                        status = future.result()
+                    except StiltsError as e:
+                        failed[name] = e
+                        continue
+                    if status > 0:
+                        failed[name] = f"status={status}"
+                        continue
+                    results[name] = status
+                    state[name] = {"cmd_hash": self.command_hash(self.steps[name])}
+                    self.write_state(state)
+        if len(failed) > 0:
+            msg = "\n".join(f"{name}: {e}" for name, e in failed.items())
+            raise StiltsWorkflowError(f"workflow steps failed:\n{msg}")
+        return results
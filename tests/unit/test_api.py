@@ -1,4 +1,5 @@
 import os
+import shlex
 import pytest
 from pathlib import Path
 
@@ -125,6 +126,34 @@ class Test__PystiltsTest:
             + "join=all1 error=0.500000"
         )
 
+    def test__argv(self,):
+        st = Stilts(
+            "tpipe", "verbose", stdout="stdout_here",
+            in_="my table.fits", cmd="select x>1; keepcols 'x y'",
+        )
+        assert st.argv == [
+            "stilts", "tpipe", "-verbose", "-stdout", "stdout_here",
+            "cmd=select x>1; keepcols 'x y'", "in=my table.fits",
+        ]
+        # cmd is the shell-quoted equivalent, for display.
+        assert st.cmd.startswith("stilts tpipe -verbose -stdout stdout_here ")
+        assert "'in=my table.fits'" in st.cmd
+        assert shlex.split(st.cmd) == st.argv
+
+        st.update_parameters(out="out.fits")
+        assert st.argv[-1] == "out=out.fits"
+
+    def test__run_without_shell(self, tmp_path):
+        tab = Table({"x": np.arange(10).astype(float)})
+        input_path = tmp_path / "input table.fits"
+        tab.write(input_path)
+        output_path = tmp_path / "output table.fits"
+        st = Stilts.tpipe(
+            in_=input_path, out=output_path, cmd="select x>4", all_formats="fits"
+        )
+        assert st.run() == 0
+        assert len(Table.read(output_path)) == 5
+
     def test__param_checker_for_paramN(self,):
         st = Stilts("tmatchn", in3="table3.cat.fits", ifmt3="csv")
         assert "in3" not in st.known_task_parameters
@@ -0,0 +1,159 @@
+import os
+import subprocess
+import sys
+import time
+import pytest
+from pathlib import Path
+
+import numpy as np
+
+from astropy.table import Table
+
+import stilts_wrapper
+from stilts_wrapper import Stilts, StiltsError, FileQueue
+
+def _make_table(N=10):
+    return Table({"x": np.arange(N).astype(float)})
+
+class Test__FileQueue:
+
+    def test__submit_claim_complete(self, tmp_path):
+        fq = FileQueue(tmp_path / "queue")
+        st = Stilts.tpipe("verbose", in_=tmp_path / "in.fits", out=tmp_path / "out.fits")
+        job_id = fq.submit(st, job_id="job1")
+        assert job_id == "job1"
+        assert fq.summary() == {"pending": 1, "running": 0, "done": 0, "failed": 0}
+        with pytest.raises(StiltsError):
+            fq.submit(st, job_id="job1")
+
+        job = fq.claim("worker_a")
+        assert job["job_id"] == "job1"
+        assert job["task"] == "tpipe"
+        assert job["flags"] == {"verbose": "None"}
+        assert job["parameters"]["in"] == str(tmp_path / "in.fits")
+        assert job["outputs"] == [str(tmp_path / "out.fits")]
+        assert job["attempts"] == 1
+        assert fq.claim("worker_b") is None # only one job, already claimed.
+        assert fq.status("job1")[0] == "running"
+
+        fq.complete(job, 0)
+        assert fq.summary() == {"pending": 0, "running": 0, "done": 1, "failed": 0}
+        state, record = fq.status("job1")
+        assert state == "done"
+        assert record["worker"] == "worker_a"
+        with pytest.raises(StiltsError):
+            fq.status("not_a_job")
+
+    def test__stages_table_inputs(self, tmp_path):
+        fq = FileQueue(tmp_path / "queue")
+        st = Stilts.tpipe(in_=_make_table(), out=tmp_path / "out.fits")
+        temp_path = Path.cwd() / "api_written_temp_tpipe_in.cat.fits"
+        job_id = fq.submit(st)
+        assert not temp_path.exists()
+        job = fq.claim("worker_a")
+        staged_path = Path(job["parameters"]["in"])
+        assert staged_path.parent == tmp_path / "queue" / "staged" / job_id
+        assert staged_path.exists()
+        assert job["inputs"] == [str(staged_path)]
+        fq.complete(job, 0)
+        assert not staged_path.exists()
+
+    def test__expired_lease_is_requeued(self, tmp_path):
+        fq = FileQueue(tmp_path / "queue", lease_timeout=60., max_attempts=2)
+        fq.submit(Stilts.tpipe(in_="in.fits"), job_id="job1")
+        job = fq.claim("crashed_worker")
+        assert fq.requeue_expired() == [] # lease still fresh.
+
+        old = time.time() - 120.
+        os.utime(tmp_path / "queue" / "running" / "job1.json", (old, old))
+        assert fq.requeue_expired() == ["job1"]
+        assert fq.summary()["pending"] == 1
+
+        job = fq.claim("worker_b")
+        assert job["attempts"] == 2
+        assert job["worker"] == "worker_b"
+
+        os.utime(tmp_path / "queue" / "running" / "job1.json", (old, old))
+        fq.requeue_expired()
+        assert fq.claim("worker_c") is None # too many attempts.
+        assert fq.status("job1")[0] == "failed"
+
+    def test__claims_oldest_first(self, tmp_path):
+        fq = FileQueue(tmp_path / "queue")
+        now = time.time()
+        for ii, job_id in enumerate(["job_c", "job_a", "job_b"]):
+            fq.submit(Stilts.tpipe(in_="in.fits"), job_id=job_id)
+            submitted = now - 100. + ii
+            os.utime(tmp_path / "queue" / "pending" / f"{job_id}.json", (submitted, submitted))
+        claimed = [fq.claim("worker_a")["job_id"] for _ in range(3)]
+        assert claimed == ["job_c", "job_a", "job_b"]
+
+    def test__claim_races(self, tmp_path, monkeypatch):
+        fq = FileQueue(tmp_path / "queue", lease_timeout=60.)
+        fq.submit(Stilts.tpipe(in_="in.fits"), job_id="job1")
+        old = time.time() - 120. # waited in pending/ for longer than the lease.
+        os.utime(tmp_path / "queue" / "pending" / "job1.json", (old, old))
+
+        rename = os.rename
+        requeued = []
+        def rename_then_requeue(src, dst):
+            rename(src, dst)
+            requeued.extend(FileQueue(tmp_path / "queue", lease_timeout=60.).requeue_expired())
+        monkeypatch.setattr(os, "rename", rename_then_requeue)
+        job = fq.claim("worker_a") # another worker requeues just after the rename...
+        assert job["job_id"] == "job1"
+        assert requeued == [] # ...but the lease is already fresh.
+        assert fq.status("job1")[0] == "running"
+
+        fq.submit(Stilts.tpipe(in_="in.fits"), job_id="job2")
+        def rename_then_vanish(src, dst):
+            rename(src, dst)
+            os.remove(dst) # eg. claimed and completed by another worker.
+        monkeypatch.setattr(os, "rename", rename_then_vanish)
+        assert fq.claim("worker_b") is None
+
+    def test__heartbeat_renews_lease(self, tmp_path):
+        fq = FileQueue(tmp_path / "queue", lease_timeout=60.)
+        fq.submit(Stilts.tpipe(in_="in.fits"), job_id="job1")
+        fq.claim("worker_a")
+        old = time.time() - 120.
+        os.utime(tmp_path / "queue" / "running" / "job1.json", (old, old))
+        fq.heartbeat("job1")
+        assert fq.requeue_expired() == []
+
+def test__worker_processes(tmp_path):
+    root = tmp_path / "queue"
+    fq = FileQueue(root)
+    input_path = tmp_path / "input.fits"
+    _make_table().write(input_path)
+    job_ids = [
+        fq.submit(Stilts.tpipe(
+            in_=input_path, out=tmp_path / f"out{ii}.fits", all_formats="fits"
+        ))
+        for ii in range(12)
+    ]
+    job_ids.append(fq.submit(Stilts.tpipe(in_=tmp_path / "missing.fits", out=tmp_path / "bad.fits")))
+
+    env = dict(os.environ)
+    package_dir = str(Path(stilts_wrapper.__file__).parent.parent)
+    env["PYTHONPATH"] = os.pathsep.join([package_dir, env.get("PYTHONPATH", "")])
+    workers = [
+        subprocess.Popen(
+            [
+                sys.executable, "-m", "stilts_wrapper.distributed", str(root),
+                "--worker-id", f"worker{ii}", "--poll-interval", "0.1", "--exit-when-empty"
+            ],
+            env=env,
+        )
+        for ii in range(3)
+    ]
+    for worker in workers:
+        assert worker.wait(timeout=600) == 0
+
+    fq.wait(job_ids, timeout=1.)
+    assert fq.summary() == {"pending": 0, "running": 0, "done": 12, "failed": 1}
+    for ii in range(12):
+        assert (tmp_path / f"out{ii}.fits").exists()
+    state, record = fq.status(job_ids[-1])
+    assert state == "failed"
+    assert record["error"] is not None
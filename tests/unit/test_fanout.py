@@ -0,0 +1,82 @@
+import pytest
+
+import numpy as np
+
+from astropy.table import Table
+
+from stilts_wrapper import Fanout, StiltsError
+
+def _make_table(N=100):
+    return Table({
+        "x": np.arange(N).astype(float),
+        "y": np.linspace(0, 1, N),
+    })
+
+class Test__Fanout:
+
+    def test__builds_single_tmultin(self, tmp_path):
+        specs = [
+            ("select x<10", tmp_path / "out1.fits"),
+            (["select x>=10", "keepcols y"], tmp_path / "out2.fits"),
+            (None, tmp_path / "out3.fits"),
+        ]
+        fo = Fanout(tmp_path / "input.fits", specs, ifmt="fits")
+        assert fo.stilts.task == "tmultin"
+        assert fo.stilts.parameters["nin"] == 3
+        for ii in [1, 2, 3]:
+            assert fo.stilts.parameters[f"in{ii}"] == tmp_path / "input.fits"
+            assert fo.stilts.parameters[f"ifmt{ii}"] == "fits"
+        assert "icmd1=select x<10" in fo.stilts.argv
+        assert "icmd2=select x>=10;keepcols y" in fo.stilts.argv
+        assert "'icmd1=select x<10'" in fo.cmd
+        assert "icmd3" not in fo.cmd
+        assert fo.cmd.startswith("stilts tmultin ")
+
+        assert fo.convert is None # fits input is used directly.
+
+        with pytest.raises(StiltsError):
+            Fanout(tmp_path / "input.fits", [])
+        with pytest.raises(StiltsError):
+            Fanout(tmp_path / "input.fits", [("select x<10", tmp_path / "out.csv")])
+
+    def test__converts_non_fits_input_once(self, tmp_path):
+        specs = [
+            ("select x<10", tmp_path / "out1.fits"),
+            ("select x>=10", tmp_path / "out2.fits"),
+        ]
+        fo = Fanout(tmp_path / "input.csv", specs)
+        assert fo.convert.task == "tpipe"
+        assert fo.convert.parameters["in"] == tmp_path / "input.csv"
+        converted_path = fo.convert.parameters["out"]
+        assert fo.stilts.parameters["in1"] == converted_path
+        assert fo.stilts.parameters["in2"] == converted_path
+        assert fo.stilts.parameters["ifmt1"] == "fits"
+
+        fo = Fanout(tmp_path / "input.dat", specs, ifmt="votable")
+        assert fo.convert.parameters["ifmt"] == "votable"
+
+    def test__run_fanout(self, tmp_path):
+        specs = [
+            ("select x<10", tmp_path / "out1.fits"),
+            (["select x>=10", "keepcols y"], tmp_path / "out2.fits"),
+        ]
+        fo = Fanout(_make_table(), specs)
+        other = Fanout(_make_table(), specs)
+        input_path = fo.input_path
+        assert input_path.parent == tmp_path
+        assert input_path.exists()
+        assert other.input_path != input_path
+        assert other.multi_path != fo.multi_path
+        other.cleanup()
+        assert input_path.exists() # not removed by the other Fanout.
+        status = fo.run()
+        assert status == 0
+        assert not input_path.exists()
+        assert not fo.multi_path.exists()
+
+        out1 = Table.read(tmp_path / "out1.fits")
+        assert len(out1) == 10
+        assert set(out1.colnames) == {"x", "y"}
+        out2 = Table.read(tmp_path / "out2.fits")
+        assert len(out2) == 90
+        assert out2.colnames == ["y"]
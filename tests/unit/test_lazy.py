@@ -0,0 +1,122 @@
+import pytest
+
+import numpy as np
+
+from astropy.io import fits
+from astropy.table import Table
+
+from stilts_wrapper import Stilts, StiltsError, LazyTable
+
+def _make_table(N=1000):
+    tab = Table({
+        "ra": np.linspace(0, 10, N),
+        "dec": np.linspace(-5, 5, N),
+        "mag": np.random.uniform(15, 22, N).astype(np.float32),
+        "id": np.arange(N),
+    })
+    tab["ra"].unit = "deg"
+    return tab
+
+FITS_CODES = {"f8": "D", "f4": "E", "i8": "K"}
+
+def _write_colfits(tab, path):
+    # one row, one cell per column - as STILTS' colfits-basic.
+    columns = [
+        fits.Column(
+            name=name, format=f"{len(tab)}{FITS_CODES[tab[name].dtype.str[1:]]}",
+            unit=str(tab[name].unit) if tab[name].unit is not None else None,
+            array=np.array(tab[name])[None, :], dim=f"({len(tab)})"
+        )
+        for name in tab.colnames
+    ]
+    fits.HDUList([fits.PrimaryHDU(), fits.BinTableHDU.from_columns(columns)]).writeto(path)
+
+class Test__LazyTable:
+
+    def test__fits(self, tmp_path):
+        tab = _make_table()
+        path = tmp_path / "table.fits"
+        tab.write(path)
+
+        with LazyTable(path) as lazy:
+            assert len(lazy) == 1000
+            assert lazy.colnames == ["ra", "dec", "mag", "id"]
+            assert lazy.schema["mag"][0] == np.float32
+            assert lazy.schema["ra"][1] == "deg"
+            assert np.allclose(lazy["ra"], tab["ra"])
+
+            sub = lazy[["ra", "id"]]
+            assert isinstance(sub, Table)
+            assert sub.colnames == ["ra", "id"]
+            assert len(sub) == 1000
+            assert sub["ra"].unit == "deg"
+
+            rows = lazy[100:110]
+            assert len(rows) == 10
+            assert np.all(rows["id"] == np.arange(100, 110))
+            assert len(lazy[5]) == 1
+
+            part = lazy.to_table(columns=["mag"], rows=np.array([1, 3, 5]))
+            assert np.allclose(part["mag"], tab["mag"][[1, 3, 5]])
+
+            with pytest.raises(KeyError):
+                lazy["bad_column"]
+
+    def test__colfits(self, tmp_path):
+        tab = _make_table()
+        path = tmp_path / "table.colfits"
+        _write_colfits(tab, path)
+
+        with LazyTable(path) as lazy:
+            assert lazy.columnar
+            assert len(lazy) == 1000
+            assert lazy.schema["mag"][0] == np.float32
+            assert lazy["id"].shape == (1000,)
+            assert np.allclose(lazy["dec"], tab["dec"])
+            rows = lazy.to_table(columns=["id", "mag"], rows=slice(990, None))
+            assert np.all(rows["id"] == np.arange(990, 1000))
+
+        with pytest.raises(StiltsError):
+            LazyTable(tmp_path / "table.colfits", hdu=0)
+
+    def test__closes_file_on_error(self, tmp_path, monkeypatch):
+        path = tmp_path / "table.fits"
+        _make_table().write(path)
+        opened = []
+        fits_open = fits.open
+        def spy_open(*args, **kwargs):
+            opened.append(fits_open(*args, **kwargs))
+            return opened[-1]
+        monkeypatch.setattr(fits, "open", spy_open)
+
+        with pytest.raises(StiltsError):
+            LazyTable(path, hdu=0) # primary HDU - not a table.
+        with pytest.raises(IndexError):
+            LazyTable(path, hdu=5)
+        assert len(opened) == 2
+        assert all(hdul._file.closed for hdul in opened)
+
+    def test__run_lazy(self, tmp_path):
+        input_path = tmp_path / "input.fits"
+        _make_table().write(input_path)
+        st = Stilts.tpipe(in_=input_path, out=tmp_path / "output.fits", all_formats="fits")
+        with st.run(lazy=True) as result:
+            assert isinstance(result, LazyTable)
+            assert len(result) == 1000
+
+        st = Stilts.tpipe(in_=input_path, all_formats="fits")
+        with pytest.raises(StiltsError):
+            st.lazy_result()
+
+        # formats LazyTable can't read fail before anything is opened.
+        st = Stilts.tpipe(in_=input_path, out=tmp_path / "output.fits", ofmt="csv")
+        with pytest.raises(StiltsError):
+            st.lazy_result()
+        st = Stilts.tpipe(in_=input_path, out=tmp_path / "output.csv")
+        with pytest.raises(StiltsError):
+            st.lazy_result()
+        st = Stilts.tpipe(in_=input_path, out=tmp_path / "output.colfits", ofmt="colfits-basic")
+        _write_colfits(_make_table(), tmp_path / "output.colfits")
+        with st.lazy_result() as result:
+            assert result.columnar
+            assert len(result) == 1000
@@ -0,0 +1,133 @@
+import pytest
+
+import numpy as np
+
+from astropy.table import Table
+
+from stilts_wrapper import Stilts, StiltsError, partition
+
+def _random_table(N=500, seed=0):
+    rng = np.random.default_rng(seed)
+    return Table({
+        "ra": rng.uniform(0, 360, N),
+        "dec": np.degrees(np.arcsin(rng.uniform(-1, 1, N))),
+        "mag": rng.uniform(15, 22, N),
+        "field": rng.integers(0, 3, N),
+    })
+
+def test__healpix_nest_index():
+    # order 0 is the twelve base faces.
+    assert partition.healpix_nest_index(0, 45., 60.) == 0
+    assert partition.healpix_nest_index(0, 135., 60.) == 1
+    assert partition.healpix_nest_index(0, 90., 0.) == 5
+    assert partition.healpix_nest_index(0, 45., -60.) == 8
+    # nested: the children of a pixel at order k+1 are 4*ipix...4*ipix+3
+    tab = _random_table()
+    idx3 = partition.healpix_nest_index(3, tab["ra"], tab["dec"])
+    idx4 = partition.healpix_nest_index(4, tab["ra"], tab["dec"])
+    assert np.all(idx4 // 4 == idx3)
+    assert np.all((0 <= idx4) & (idx4 < 12 * 4 ** 4))
+
+def test__write_and_read_partitioned(tmp_path):
+    tab = _random_table()
+    output_dir = tmp_path / "partitioned"
+    input_path = tmp_path / "input.fits"
+    tab.write(input_path)
+    manifest = partition.write_partitioned(input_path, output_dir, order=1)
+
+    assert (output_dir / "manifest.json").exists()
+    assert manifest["nrows"] == len(tab)
+    assert sum(p["nrows"] for p in manifest["partitions"]) == len(tab)
+    for part in manifest["partitions"]:
+        assert (output_dir / part["path"]).exists()
+        assert part["stats"]["mag"]["min"] >= 15.
+        assert part["stats"]["mag"]["max"] <= 22.
+
+    full = partition.read_partitioned(output_dir)
+    assert len(full) == len(tab)
+    assert set(full.colnames) == set(tab.colnames)
+
+    tile = manifest["partitions"][0]["tile"]
+    subset = partition.read_partitioned(output_dir, tiles=[tile], columns=["ra", "mag"])
+    assert subset.colnames == ["ra", "mag"]
+    expected = partition.healpix_nest_index(1, tab["ra"], tab["dec"]) == tile
+    assert len(subset) == expected.sum()
+    assert np.allclose(np.sort(subset["mag"]), np.sort(tab["mag"][expected]))
+
+def test__partition_column(tmp_path):
+    tab = _random_table()
+    output_dir = tmp_path / "partitioned"
+    manifest = partition.write_partitioned(
+        tab, output_dir, order=0, partition_column="field"
+    )
+    assert set(p["value"] for p in manifest["partitions"]) == {0, 1, 2}
+    for part in manifest["partitions"]:
+        rows = (tab["field"] == part["value"]) & (
+            partition.healpix_nest_index(0, tab["ra"], tab["dec"]) == part["tile"]
+        )
+        assert part["nrows"] == rows.sum()
+    field1 = partition.read_partitioned(output_dir, values=[1])
+    assert len(field1) == (tab["field"] == 1).sum()
+    assert np.all(field1["field"] == 1)
+
+def test__string_partition_column(tmp_path):
+    tab = _random_table()
+    tab["band"] = np.array(["g", "r", "i"])[tab["field"]]
+    input_path = tmp_path / "input.fits"
+    tab.write(input_path) # strings come back from fits as bytes.
+    output_dir = tmp_path / "partitioned"
+    manifest = partition.write_partitioned(
+        input_path, output_dir, order=0, partition_column="band"
+    )
+    assert set(p["value"] for p in manifest["partitions"]) == {"g", "r", "i"}
+    assert partition.load_manifest(output_dir) == manifest
+    assert all("value=" in p["path"] and "b'" not in p["path"] for p in manifest["partitions"])
+    band_r = partition.read_partitioned(output_dir, values=["r"])
+    assert len(band_r) == (tab["band"] == "r").sum()
+    assert np.all(band_r["band"] == "r")
+    assert len(list(output_dir.glob("*.tmp"))) == 0
+
+def test__parquet(tmp_path):
+    pytest.importorskip("pyarrow")
+    pytest.importorskip("pandas")
+    tab = _random_table()
+    output_dir = tmp_path / "partitioned"
+    manifest = partition.write_partitioned(tab, output_dir, order=1, fmt="parquet")
+    assert all(p["path"].endswith(".parquet") for p in manifest["partitions"])
+    full = partition.read_partitioned(output_dir)
+    assert len(full) == len(tab)
+    subset = partition.read_partitioned(output_dir, columns=["mag", "ra"])
+    assert subset.colnames == ["mag", "ra"]
+    assert np.allclose(np.sort(subset["mag"]), np.sort(tab["mag"]))
+
+def test__bad_inputs(tmp_path):
+    with pytest.raises(StiltsError):
+        partition.write_partitioned(_random_table(), tmp_path, fmt="bad_fmt")
+    with pytest.raises(StiltsError):
+        partition.read_partitioned(tmp_path / "not_a_dataset")
+
+def test__run_partitioned(tmp_path):
+    tab = _random_table()
+    input_path = tmp_path / "input.fits"
+    tab.write(input_path)
+    output_dir = tmp_path / "partitioned"
+    st = Stilts.tpipe(in_=input_path, ifmt="fits")
+    cmd = st.cmd
+    status = partition.run_partitioned(st, output_dir, order=2)
+    assert status == 0
+    assert "out" not in st.parameters # caller's job is untouched.
+    assert st.cmd == cmd
+    assert len(list(output_dir.glob("api_written_temp*"))) == 0
+    result = partition.read_partitioned(output_dir)
+    assert len(result) == len(tab)
+
+def test__run_partitioned_table_input(tmp_path):
+    tab = _random_table()
+    st = Stilts.tpipe(in_=tab, ifmt="fits")
+    temp_paths = list(st.cleanup_paths)
+    assert len(temp_paths) == 1
+    status = partition.run_partitioned(st, tmp_path / "partitioned", order=1)
+    assert status == 0
+    assert temp_paths[0].exists() # still the caller's to clean up.
+    st.cleanup()
+    assert not temp_paths[0].exists()
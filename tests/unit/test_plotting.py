@@ -0,0 +1,109 @@
+import pytest
+
+import numpy as np
+
+from astropy.table import Table
+
+from stilts_wrapper import StiltsError, plotting
+
+def test__shared_inputs():
+    specs = [
+        {"task": "plot2plane", "out": "a.png", "in": "t1.csv", "x": "a", "y": "b"},
+        {"task": "plot2plane", "out": "b.png", "in": "t2.csv", "x": "a", "y": "b"},
+        {"task": "plot2plane", "out": "c.png", "in": "t1.csv", "x": "c", "y": "d"},
+        {"task": "plot2sky", "out": "d.png", "in1": "t2.csv", "in2": "t1.csv"},
+        {"task": "plot2plane", "out": "e.png", "in": "t3.fits", "x": "a", "y": "b"},
+        {"task": "plot2plane", "out": "f.png", "in": "t3.fits", "x": "c", "y": "d"},
+        {"task": "plot2plane", "out": "g.png", "in": "t4.dat", "ifmt": "fits"},
+        {"task": "plot2plane", "out": "h.png", "in": "t4.dat", "ifmt": "fits"},
+    ]
+    shared = plotting.shared_inputs(specs)
+    # fits inputs are memory-mapped already, so they're left alone.
+    assert shared == {
+        ("t1.csv", None): [(0, "in"), (2, "in"), (3, "in2")],
+        ("t2.csv", None): [(1, "in"), (3, "in1")],
+    }
+
+def test__convert_shared_inputs(tmp_path):
+    table_path = tmp_path / "table.csv"
+    Table({"x": [1., 2.], "y": [3., 4.]}).write(table_path, format="ascii.csv")
+    specs = [
+        {"task": "plot2plane", "out": tmp_path / f"plot{ii}.png", "in": table_path, "ifmt": "csv"}
+        for ii in range(3)
+    ] + [{"task": "plot2plane", "out": tmp_path / "other.png", "in": tmp_path / "other.csv"}]
+    new_specs, temp_paths = plotting.convert_shared_inputs(specs, work_dir=tmp_path)
+    assert len(temp_paths) == 1
+    assert temp_paths[0].exists()
+    for spec in new_specs[:3]:
+        assert spec["in"] == temp_paths[0]
+        assert spec["ifmt"] == "fits"
+    assert new_specs[3] == specs[3] # not shared.
+    assert specs[0]["in"] == table_path # the caller's specs are untouched.
+
+def test__bad_plot_spec():
+    with pytest.raises(StiltsError):
+        plotting.render_plots([{"out": "a.png", "in": "t1.fits"}])
+    assert plotting.render_plots([]) == []
+
+def test__get_free_port():
+    port = plotting.get_free_port()
+    assert isinstance(port, int)
+    assert port > 0
+
+def test__render_plots(tmp_path):
+    tab = Table({
+        "x": np.random.uniform(0, 1, 100),
+        "y": np.random.uniform(0, 1, 100),
+    })
+    table_path = tmp_path / "table.fits"
+    tab.write(table_path)
+
+    specs = [
+        {
+            "task": "plot2plane", "out": tmp_path / f"plot{ii}.png",
+            "in": table_path, "x": "x", "y": "y", "layer": "mark",
+        }
+        for ii in range(4)
+    ]
+    specs.append({
+        "task": "plot2plane", "out": tmp_path / "bad_plot.png",
+        "in": tmp_path / "missing.fits", "x": "x", "y": "y", "layer": "mark",
+    })
+    specs.append({ # a plain OSError when writing, rather than a StiltsError.
+        "task": "plot2plane", "out": tmp_path / "no_such_dir" / "plot.png",
+        "in": table_path, "x": "x", "y": "y", "layer": "mark",
+    })
+    specs.append({
+        "task": "plot2plane", "out": tmp_path / "last_plot.png",
+        "in": table_path, "x": "x", "y": "y", "layer": "mark",
+    })
+    results = plotting.render_plots(specs, n_workers=2)
+
+    assert len(results) == 7
+    for ii in range(4):
+        assert results[ii]["status"] == "ok"
+        assert results[ii]["error"] is None
+        assert results[ii]["time"] > 0
+        with open(tmp_path / f"plot{ii}.png", "rb") as f:
+            assert f.read(8) == b"\x89PNG\r\n\x1a\n"
+    assert results[4]["status"] == "failed"
+    assert isinstance(results[4]["error"], str)
+    # the worker carries on after an unexpected error.
+    assert results[5]["status"] == "failed"
+    assert isinstance(results[5]["error"], str)
+    assert results[6]["status"] == "ok"
+    assert set(r["worker"] for r in results) <= {0, 1}
+
+def test__render_plots_shared_input(tmp_path):
+    table_path = tmp_path / "table.csv"
+    Table({"x": [1., 2.], "y": [3., 4.]}).write(table_path, format="ascii.csv")
+    specs = [
+        {
+            "task": "plot2plane", "out": tmp_path / f"plot{ii}.png",
+            "in": table_path, "ifmt": "csv", "x": "x", "y": "y", "layer": "mark",
+        }
+        for ii in range(3)
+    ]
+    results = plotting.render_plots(specs, n_workers=2, work_dir=tmp_path)
+    assert [r["status"] for r in results] == ["ok"] * 3
+    assert len(list(tmp_path.glob("api_written_temp*"))) == 0
@@ -0,0 +1,173 @@
+import io
+import threading
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from astropy.io.votable import from_table
+from astropy.table import Table
+
+from stilts_wrapper import StiltsError, vo
+
+class StandInConeService:
+    """
+    Minimal local cone search service. Returns one row per request (at the
+    requested position), fails the first n_failures requests with HTTP 500,
+    and records the most requests it saw in flight at once.
+    """
+
+    def __init__(self, n_failures=0, delay=0.2):
+        self.n_failures = n_failures
+        self.delay = delay
+        self.n_requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+        service = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                service.handle(self)
+            def log_message(self, *args):
+                pass
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/cone?"
+
+    def handle(self, request):
+        with self.lock:
+            self.n_requests += 1
+            fail = self.n_requests <= self.n_failures
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            if fail:
+                request.send_response(500)
+                request.end_headers()
+                return
+            query = parse_qs(urlparse(request.path).query)
+            tab = Table({
+                "ra": [float(query["RA"][0])],
+                "dec": [float(query["DEC"][0])],
+            })
+            buf = io.BytesIO()
+            from_table(tab).to_xml(buf)
+            request.send_response(200)
+            request.send_header("Content-Type", "text/xml")
+            request.end_headers()
+            request.wfile.write(buf.getvalue())
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+class FlakyJob:
+    """Stands in for a Stilts job which fails the first n_failures runs."""
+
+    task = "flaky"
+    cmd = "flaky"
+
+    def __init__(self, n_failures, events=None, delay=0.):
+        self.n_failures = n_failures
+        self.n_runs = 0
+        self.delay = delay
+        self.events = events if events is not None else []
+
+    def run(self, strict=True, cleanup=True):
+        self.n_runs += 1
+        time.sleep(self.delay)
+        self.events.append(("run", self))
+        if self.n_runs <= self.n_failures:
+            raise StiltsError("failed")
+        return 0
+
+    def cleanup(self,):
+        self.events.append(("cleanup", self))
+
+def test__chunk_table():
+    tab = Table({"x": np.arange(25)})
+    chunks = vo.chunk_table(tab, 10)
+    assert [len(c) for c in chunks] == [10, 10, 5]
+    assert np.all(np.concatenate([c["x"] for c in chunks]) == tab["x"])
+
+def test__run_with_retries():
+    job = FlakyJob(n_failures=2)
+    assert vo.run_with_retries(job, retries=3, backoff=0.01) == 2
+    assert job.n_runs == 3
+
+    job = FlakyJob(n_failures=5)
+    with pytest.raises(StiltsError):
+        vo.run_with_retries(job, retries=2, backoff=0.01)
+    assert job.n_runs == 3
+
+def test__run_concurrently_cancels_on_failure():
+    events = []
+    failing = FlakyJob(n_failures=10, events=events)
+    slow = FlakyJob(n_failures=0, events=events, delay=0.3)
+    queued = [FlakyJob(n_failures=0, events=events) for _ in range(5)]
+    jobs = [slow, failing] + queued
+    with pytest.raises(StiltsError):
+        vo.run_concurrently(jobs, max_workers=2, retries=1, backoff=0.01)
+    # jobs which hadn't started never run...
+    assert all(job.n_runs == 0 for job in queued)
+    # ...and nothing is cleaned up until the running jobs have finished.
+    first_cleanup = [event[0] for event in events].index("cleanup")
+    assert ("run", slow) in events[:first_cleanup]
+    assert sum(1 for event in events if event[0] == "cleanup") == len(jobs)
+
+def test__skymatch_fanout_bad_task():
+    with pytest.raises(StiltsError):
+        vo.skymatch_fanout("tpipe", Table({"x": [1, 2]}))
+
+def test__cone_fanout_concurrency(tmp_path):
+    positions = [(float(ii), float(ii) / 2.) for ii in range(8)]
+    with StandInConeService(delay=0.5) as service:
+        result = vo.cone_fanout(
+            service.url, positions, radius=0.01, chunk_size=2, max_workers=3,
+            work_dir=tmp_path
+        )
+    assert service.n_requests == 8
+    assert 1 < service.max_in_flight <= 3
+    assert len(result) == 8
+    assert sorted(result["query_id"]) == list(range(8))
+    for row in result:
+        assert np.isclose(row["ra"], positions[row["query_id"]][0])
+        assert np.isclose(row["query_ra"], positions[row["query_id"]][0])
+    assert len(list(tmp_path.glob("api_written_temp*"))) == 0
+
+    # each job can make parallel queries, on top of max_workers jobs.
+    with StandInConeService(delay=0.5) as service:
+        result = vo.cone_fanout(
+            service.url, positions, radius=0.01, chunk_size=4, max_workers=2,
+            parallel=2, work_dir=tmp_path
+        )
+    assert 2 < service.max_in_flight <= 4
+    assert len(result) == 8
+
+def test__cone_fanout_retries(tmp_path):
+    positions = [(10., 10.), (20., 20.)]
+    with StandInConeService(n_failures=2, delay=0.) as service:
+        result = vo.cone_fanout(
+            service.url, positions, radius=0.01, chunk_size=1, max_workers=1,
+            retries=3, backoff=0.01, work_dir=tmp_path
+        )
+    assert service.n_requests == 4
+    assert len(result) == 2
+
+    with StandInConeService(n_failures=10, delay=0.) as service:
+        with pytest.raises(StiltsError):
+            vo.cone_fanout(
+                service.url, positions, radius=0.01, chunk_size=1, max_workers=1,
+                retries=1, backoff=0.01, work_dir=tmp_path
+            )
+    assert len(list(tmp_path.glob("api_written_temp*"))) == 0
@@ -0,0 +1,162 @@
+import os
+import time
+import pytest
+
+import numpy as np
+
+from astropy.table import Table
+
+from stilts_wrapper import Stilts, Workflow, StiltsError, StiltsWorkflowError
+
+def _write_table(path, N=10):
+    tab = Table({
+        "ra": np.linspace(1, 10, N).astype(float),
+        "dec": np.zeros(N).astype(float),
+    })
+    tab.write(path, overwrite=True)
+
+class FailingStilts(Stilts):
+    """Writes a partial output, then fails - like an interrupted STILTS run."""
+
+    def run(self, *args, **kwargs):
+        for path in self.get_output_paths():
+            path.write_bytes(b"partial")
+        raise StiltsError("run: Something went wrong (status=1).")
+
+class Test__Workflow:
+
+    def test__infers_dependencies(self, tmp_path):
+        wf = Workflow(state_path=tmp_path / "state.json")
+        a = wf.add(Stilts.tpipe(in_=tmp_path / "raw.fits", out=tmp_path / "a.fits"))
+        b = wf.add(Stilts.tpipe(in_=tmp_path / "raw.fits", out=tmp_path / "b.fits"))
+        c = wf.add(
+            Stilts.tskymatch2(in1=tmp_path / "a.fits", in2=tmp_path / "b.fits", out=tmp_path / "c.fits"),
+            name="match"
+        )
+        assert c == "match"
+        deps = wf.get_dependencies()
+        assert deps[a] == set()
+        assert deps[b] == set()
+        assert deps["match"] == {a, b}
+        order = wf.topological_order()
+        assert order.index("match") > order.index(a)
+        assert order.index("match") > order.index(b)
+
+    def test__multiple_inputs_in_one_parameter(self, tmp_path):
+        raw_path = tmp_path / "raw.fits"
+        _write_table(raw_path)
+        state_path = tmp_path / "state.json"
+
+        def build_workflow():
+            wf = Workflow(state_path=state_path)
+            wf.add(Stilts.tpipe(in_=raw_path, out=tmp_path / "a.fits", all_formats="fits"), name="a")
+            wf.add(Stilts.tpipe(in_=raw_path, out=tmp_path / "b.fits", all_formats="fits"), name="b")
+            wf.add(Stilts(
+                "tcat", in_=f"{tmp_path / 'a.fits'} {tmp_path / 'b.fits'}",
+                out=tmp_path / "cat.fits", ifmt="fits", ofmt="fits"
+            ), name="cat")
+            return wf
+
+        wf = build_workflow()
+        assert wf.get_dependencies()["cat"] == {"a", "b"}
+        assert wf.run() == {"a": 0, "b": 0, "cat": 0}
+        assert len(Table.read(tmp_path / "cat.fits")) == 20
+        assert build_workflow().run() == {"a": "skipped", "b": "skipped", "cat": "skipped"}
+
+        time.sleep(0.01)
+        os.utime(tmp_path / "b.fits") # a stale second input reruns the tcat.
+        assert build_workflow().run() == {"a": "skipped", "b": "skipped", "cat": 0}
+
+    def test__raises_for_bad_graphs(self, tmp_path):
+        wf = Workflow(state_path=tmp_path / "state.json")
+        wf.add(Stilts.tpipe(in_=tmp_path / "x.fits", out=tmp_path / "y.fits"), name="s1")
+        with pytest.raises(StiltsWorkflowError):
+            wf.add(Stilts.tpipe(in_=tmp_path / "x.fits"), name="s1")
+        wf.add(Stilts.tpipe(in_=tmp_path / "y.fits", out=tmp_path / "x.fits"), name="s2")
+        with pytest.raises(StiltsWorkflowError):
+            wf.get_dependencies() # s1 -> s2 -> s1
+
+        wf2 = Workflow(state_path=tmp_path / "state.json")
+        wf2.add(Stilts.tpipe(in_=tmp_path / "x.fits", out=tmp_path / "y.fits"))
+        wf2.add(Stilts.tpipe(in_=tmp_path / "z.fits", out=tmp_path / "y.fits"))
+        with pytest.raises(StiltsWorkflowError):
+            wf2.get_dependencies() # two steps write y.fits
+
+    def test__run_and_skip_up_to_date(self, tmp_path):
+        raw_path = tmp_path / "raw.fits"
+        _write_table(raw_path)
+        state_path = tmp_path / "state.json"
+
+        def build_workflow():
+            wf = Workflow(state_path=state_path)
+            wf.add(Stilts.tpipe(in_=raw_path, out=tmp_path / "a.fits", all_formats="fits"), name="a")
+            wf.add(Stilts.tpipe(in_=tmp_path / "a.fits", out=tmp_path / "b.fits", all_formats="fits"), name="b")
+            return wf
+
+        results = build_workflow().run()
+        assert results == {"a": 0, "b": 0}
+        assert (tmp_path / "b.fits").exists()
+        assert state_path.exists()
+
+        results = build_workflow().run()
+        assert results == {"a": "skipped", "b": "skipped"}
+
+        # touching the raw input makes everything downstream stale.
+        time.sleep(0.01)
+        os.utime(raw_path)
+        results = build_workflow().run()
+        assert results == {"a": 0, "b": 0}
+
+        # an interrupted run has only recorded "a" - so "b" is rerun.
+        os.remove(tmp_path / "b.fits")
+        results = build_workflow().run()
+        assert results == {"a": "skipped", "b": 0}
+
+        results = build_workflow().run(force=True)
+        assert results == {"a": 0, "b": 0}
+
+    def test__changed_command_reruns(self, tmp_path):
+        raw_path = tmp_path / "raw.fits"
+        _write_table(raw_path)
+        state_path = tmp_path / "state.json"
+        wf = Workflow(state_path=state_path)
+        wf.add(Stilts.tpipe(in_=raw_path, out=tmp_path / "a.fits", all_formats="fits"), name="a")
+        assert wf.run() == {"a": 0}
+
+        wf = Workflow(state_path=state_path)
+        wf.add(Stilts.tpipe(in_=raw_path, out=tmp_path / "a.fits", ofmt="fits"), name="a")
+        assert wf.run() == {"a": 0}
+
+    def test__failing_step_raises(self, tmp_path):
+        wf = Workflow(state_path=tmp_path / "state.json")
+        wf.add(Stilts.tpipe(in_=tmp_path / "missing.fits", out=tmp_path / "a.fits"), name="a")
+        wf.add(Stilts.tpipe(in_=tmp_path / "a.fits", out=tmp_path / "b.fits"), name="b")
+        with pytest.raises(StiltsWorkflowError):
+            wf.run()
+        assert not (tmp_path / "b.fits").exists()
+
+    def test__failed_rerun_is_not_up_to_date(self, tmp_path):
+        raw_path = tmp_path / "raw.fits"
+        _write_table(raw_path)
+        state_path = tmp_path / "state.json"
+
+        def build_workflow(cls):
+            wf = Workflow(state_path=state_path)
+            wf.add(cls.tpipe(in_=raw_path, out=tmp_path / "a.fits", all_formats="fits"), name="a")
+            return wf
+
+        assert build_workflow(Stilts).run() == {"a": 0}
+        time.sleep(0.01)
+        os.utime(raw_path) # make "a" stale...
+
+        with pytest.raises(StiltsWorkflowError):
+            build_workflow(FailingStilts).run() # ...and its rerun fails.
+        assert "a" not in build_workflow(Stilts).load_state()
+        assert build_workflow(Stilts).run() == {"a": 0}
+
+    def test__rejects_table_inputs(self, tmp_path):
+        wf = Workflow(state_path=tmp_path / "state.json")
+        st = Stilts.tpipe(in_=Table({"x": [1., 2.]}), out=tmp_path / "a.fits")
+        with pytest.raises(StiltsWorkflowError, match="step 'tpipe_0'"):
+            wf.add(st)
+        st.cleanup()